@@ -1,5 +1,4 @@
 import os
-import io
 import json
 import tempfile
 import subprocess
@@ -115,36 +114,32 @@ def _ready_probe() -> Dict[str, Any]:
         "author": "Backtato",
     }
 
-async def _safe_audio(path: str, meta: dict) -> tuple[dict, dict]:
+async def _safe_analyze(kind: str, fn, path: str, meta: dict, neutral) -> tuple[dict, dict]:
     hints_extra = {}
     try:
-        return await asyncio.wait_for(asyncio.to_thread(audio_an.analyze, path, meta), timeout=REQUEST_TIMEOUT_S), hints_extra
+        return await asyncio.wait_for(asyncio.to_thread(fn, path, meta), timeout=REQUEST_TIMEOUT_S), hints_extra
     except Exception as e:
         tlen = int(max(1, round(meta.get("duration") or 0.0)))
-        neutral = {"scores": {}, "flags_audio": {"error": str(e.__class__.__name__)}, "timeline": [0.5]*tlen}
-        hints_extra["audio_error"] = f"{e.__class__.__name__}"
+        hints_extra[f"{kind}_error"] = f"{e.__class__.__name__}"
         if DEBUG:
-            hints_extra["audio_traceback"] = traceback.format_exc()
-        return neutral, hints_extra
+            hints_extra[f"{kind}_traceback"] = traceback.format_exc()
+        return neutral(tlen, str(e.__class__.__name__)), hints_extra
+
+async def _safe_audio(path: str, meta: dict) -> tuple[dict, dict]:
+    return await _safe_analyze("audio", audio_an.analyze, path, meta,
+        lambda tlen, err: {"scores": {}, "flags_audio": {"error": err}, "timeline": [0.5]*tlen})
 
 async def _safe_video(path: str, meta: dict) -> tuple[dict, dict]:
-    hints_extra = {}
-    try:
-        return await asyncio.wait_for(asyncio.to_thread(video_an.analyze, path, meta), timeout=REQUEST_TIMEOUT_S), hints_extra
-    except Exception as e:
-        tlen = int(max(1, round(meta.get("duration") or 0.0)))
-        neutral = {"timeline": [0.5]*tlen, "summary": {"error": str(e.__class__.__name__)}, "timeline_ai": [0.5]*tlen}
-        hints_extra["video_error"] = f"{e.__class__.__name__}"
-        if DEBUG:
-            hints_extra["video_traceback"] = traceback.format_exc()
-        return neutral, hints_extra
+    return await _safe_analyze("video", video_an.analyze, path, meta,
+        lambda tlen, err: {"timeline": [0.5]*tlen, "summary": {"error": err}, "timeline_ai": [0.5]*tlen})
 
 async def _analyze_path(path: str, source_url: Optional[str]=None, resolved_url: Optional[str]=None) -> Dict[str, Any]:
     meta = _probe_basic_meta(path)
-    hints = hx.compute_hints(meta, path)
-    audio, a_hint = await _safe_audio(path, meta)
-    video, v_hint = await _safe_video(path, meta)
-    hints.update(a_hint); hints.update(v_hint)
+    # FFT NumPy e OpenCV rilasciano il GIL: audio e video girano in parallelo
+    (audio, a_hint), (video, v_hint) = await asyncio.gather(
+        _safe_audio(path, meta), _safe_video(path, meta)
+    )
+    hints = {**hx.compute_hints(meta, path), **a_hint, **v_hint}
     fused = fusion_an.fuse(audio, video, hints)
     out = {
         "ok": True,
@@ -1,98 +1,197 @@
 import os
 import subprocess
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
 import soundfile as sf
+from scipy import fft as sp_fft
 
-def _extract_wav_16k(path: str):
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-    tmp.close()
-    cmd = ["ffmpeg","-y","-i",path,"-ac","1","-ar","16000","-f","wav",tmp.name]
-    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    if proc.returncode != 0:
-        raise RuntimeError("ffmpeg_convert_failed")
+# Oltre questa durata l'audio non viene analizzato (né decodificato)
+AUDIO_MAX_SECONDS = float(os.getenv("AUDIO_MAX_SECONDS", "180"))
+# Thread per le FFT batch (-1 = tutti i core)
+FFT_WORKERS = int(os.getenv("FFT_WORKERS", "-1"))
+# Blocchi da 16 finestre da 0.5 s (512 KB float32): il blocco resta in cache L2
+# mentre se ne estraggono le feature, e la memoria è limitata anche su file lunghi
+BLOCK_WINDOWS = 16
+
+def _stream_wav_16k(path: str, blocksize: int):
+    # Blocchi float32 mono a 16 kHz, al massimo AUDIO_MAX_SECONDS
+    max_frames = int(AUDIO_MAX_SECONDS * 16000)
+    # Già WAV mono 16 kHz PCM: si legge direttamente, senza passare da ffmpeg
     try:
-        wav, sr = sf.read(tmp.name, dtype="float32", always_2d=False)
+        info = sf.info(path)
+        direct = (info.format == "WAV" and info.samplerate == 16000 and info.channels == 1
+                  and info.subtype in ("PCM_16", "PCM_24", "PCM_32", "FLOAT"))
     except Exception:
-        try: os.unlink(tmp.name)
-        except Exception: pass
-        raise RuntimeError("soundfile_read_failed")
-    return tmp.name, wav, sr
+        direct = False
+    if direct:
+        yield from sf.blocks(path, blocksize=blocksize, frames=max_frames, dtype="float32", always_2d=False)
+        return
+    # PCM f32le su stdout: niente file temporaneo né parsing del contenitore WAV
+    cmd = ["ffmpeg","-v","quiet","-i",path,"-t",str(AUDIO_MAX_SECONDS),"-vn",
+           "-ac","1","-ar","16000","-f","f32le","pipe:1"]
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, bufsize=1 << 20)
+    try:
+        remaining = max_frames
+        while remaining > 0:
+            buf = proc.stdout.read(blocksize * 4)
+            if not buf:
+                if proc.wait() != 0:
+                    raise RuntimeError("ffmpeg_convert_failed")
+                break
+            block = np.frombuffer(buf, dtype=np.float32)[:remaining]
+            remaining -= len(block)
+            yield block
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
 
-def _norm01(x):
-    x = np.asarray(x, dtype=float)
+def _norm01(x, out=None):
+    x = np.asarray(x, dtype=np.float32)
     if x.size == 0:
-        return np.zeros(1)
+        return np.zeros(1, dtype=np.float32)
     mn, mx = float(np.min(x)), float(np.max(x))
-    return (x - mn) / (mx - mn + 1e-9)
+    out = np.subtract(x, np.float32(mn), out=out)
+    out /= np.float32(mx - mn + 1e-9)
+    return out
+
+def _diff_keep_len(x):
+    # Come np.diff ma della stessa lunghezza di x, con 0 in testa
+    out = np.empty_like(x)
+    out[:1] = 0.0
+    np.subtract(x[1:], x[:-1], out=out[1:])
+    return out
+
+def _percentile(x, q):
+    # Interpolazione lineare come np.percentile, con una sola selezione parziale O(n)
+    pos = (x.size - 1) * q / 100.0
+    k = int(pos)
+    if k + 1 >= x.size:
+        return float(np.partition(x, k)[k])
+    part = np.partition(x, (k, k + 1))
+    return float(part[k] + (pos - k) * (part[k + 1] - part[k]))
+
+@lru_cache(maxsize=8)
+def _hann(n: int):
+    w = np.hanning(n).astype(np.float32)
+    w.flags.writeable = False
+    return w
+
+@lru_cache(maxsize=8)
+def _freq_axis(n: int):
+    f = np.linspace(0.0, 1.0, n, dtype=np.float32)
+    f.flags.writeable = False
+    return f
+
+def _frame_features(frames, window, out, dest):
+    # frames: (n, L) -> dest (5, n): righe rms, zcr, flatness, rolloff, centroide
+    rms = np.sqrt((frames**2).mean(axis=1))
+    sb = np.signbit(frames)
+    zcr = np.count_nonzero(sb[:, 1:] != sb[:, :-1], axis=1) / max(1, frames.shape[1] - 1)
+    winframes = np.multiply(frames, window, out=out)
+    # scipy.fft resta in float32 (numpy.fft promuove a float64) e pianifica una volta per batch
+    mag = np.abs(sp_fft.rfft(winframes, axis=1, workers=FFT_WORKERS))
+    mag += 1e-9
+    # Energia spettrale totale per frame, condivisa da flatness, rolloff e centroide
+    cum = np.cumsum(mag, axis=1)
+    total = cum[:, -1]
+    roll = (cum >= 0.85 * total[:, None]).argmax(axis=1) / max(1.0, mag.shape[1])
+    sc = (mag @ _freq_axis(mag.shape[1])) / total
+    # Ultimo uso di mag: il logaritmo per la flatness si calcola in place
+    flat = np.exp(np.log(mag, out=mag).mean(axis=1)) / (total / mag.shape[1])
+    dest[0], dest[1], dest[2], dest[3], dest[4] = rms, zcr, flat, roll, sc
+
+def _source_duration(path: str, meta: dict) -> float:
+    # Durata intera della sorgente (non limitata da AUDIO_MAX_SECONDS): da ffprobe,
+    # altrimenti dall'header per i formati che soundfile sa leggere
+    dur = float(meta.get("duration") or 0.0)
+    if dur <= 0.0:
+        try:
+            dur = float(sf.info(path).duration)
+        except Exception:
+            dur = 0.0
+    return dur
 
 def analyze(path: str, meta: dict):
-    tmp = None
     try:
-        tmp, wav, sr = _extract_wav_16k(path)
-        if wav.ndim > 1:
-            wav = wav[:, 0]
-        dur = len(wav)/sr if sr > 0 else 0.0
-
-        win = max(1, int(sr * 0.5)) if sr else 1
-        rms, zcr, flat, roll, sc_cent = [], [], [], [], []
-
-        for i in range(0, len(wav), win):
-            seg = wav[i:i+win]
-            if len(seg) == 0:
-                continue
-            rms.append(float(np.sqrt((seg**2).mean())))
-            zc = np.mean(np.abs(np.diff(np.sign(seg))))/2.0
-            zcr.append(float(zc))
-            winseg = seg * np.hanning(len(seg))
-            spec = np.fft.rfft(winseg)
-            mag = np.abs(spec) + 1e-9
-            flat.append(float(np.exp(np.mean(np.log(mag))) / np.mean(mag)))
-            cutoff = 0.85 * np.sum(mag)
-            s = 0.0
-            idx = 0
-            for k, m in enumerate(mag):
-                s += m
-                if s >= cutoff:
-                    idx = k; break
-            roll.append(float(idx) / max(1.0, len(mag)))
-            freqs = np.linspace(0.0, 1.0, len(mag))
-            sc = float(np.sum(freqs * mag) / np.sum(mag))
-            sc_cent.append(sc)
-
-        rms_arr  = np.array(rms)  if rms  else np.zeros(1)
-        zcr_arr  = np.array(zcr)  if zcr  else np.zeros(1)
-        flat_arr = np.array(flat) if flat else np.zeros(1)
-        roll_arr = np.array(roll) if roll else np.zeros(1)
-        sc_arr   = np.array(sc_cent) if sc_cent else np.zeros(1)
-
-        speech_thr = np.percentile(rms_arr, 60) if rms_arr.size else 0.0
-        speech_ratio = float(np.mean(rms_arr >= speech_thr)) if rms_arr.size else 0.0
-
-        flat_mean = float(np.mean(flat_arr)) if flat_arr.size else 0.0
-        sc_var    = float(np.var(sc_arr))    if sc_arr.size  else 0.0
-        roll_var  = float(np.var(roll_arr))  if roll_arr.size else 0.0
-        zcr_var   = float(np.var(zcr_arr))   if zcr_arr.size else 0.0
+        sr = 16000
+        win = int(sr * 0.5)
+        hann = _hann(win)
+        scratch = np.empty((BLOCK_WINDOWS, win), dtype=np.float32)
+        # Numero massimo di finestre noto a priori: feature preallocate, nessuna lista
+        max_samples = int(AUDIO_MAX_SECONDS * sr)
+        feats = np.empty((5, -(-max_samples // win)))
+        n_win = 0
+
+        n_samples = 0
+        for block in _stream_wav_16k(path, win * BLOCK_WINDOWS):
+            n_samples += len(block)
+            n_full = len(block) // win
+            if n_full:
+                frames = block[:n_full * win].reshape(n_full, win)
+                _frame_features(frames, hann, scratch[:n_full], feats[:, n_win:n_win + n_full])
+                n_win += n_full
+            # L'ultimo segmento può essere più corto della finestra
+            tail = block[n_full * win:]
+            if len(tail):
+                _frame_features(tail[None, :], _hann(len(tail)), scratch[:1, :len(tail)],
+                                feats[:, n_win:n_win + 1])
+                n_win += 1
+        dur = n_samples / sr
+
+        # Tutte le feature hanno la stessa lunghezza: statistiche in un solo passaggio
+        feats = feats[:, :n_win] if n_win else np.zeros((5, 1))
+        rms_arr, zcr_arr, flat_arr, roll_arr, sc_arr = feats
+        f_mean = feats.mean(axis=1)
+        f_var = feats.var(axis=1)
+
+        speech_thr = _percentile(rms_arr, 60)
+        speech_ratio = np.count_nonzero(rms_arr >= speech_thr) / rms_arr.size
+
+        flat_mean = float(f_mean[2])
+        rms_var, zcr_var, roll_var, sc_var = (float(x) for x in f_var[[0, 1, 3, 4]])
 
         tts_base = 0.7 * flat_mean + 0.15 * (1.0/(1e-6 + zcr_var)) + 0.15 * (1.0/(1e-6 + roll_var))
         attenuation = 1.0 / (1.0 + 5.0 * (sc_var + roll_var + zcr_var))
-        tts_like = float(np.clip(tts_base * attenuation, 0.0, 1.0))
+        tts_like = min(1.0, max(0.0, float(tts_base * attenuation)))
 
         # Cap del TTS se la variabilità non è trascurabile
         variability = sc_var + roll_var + zcr_var
         if variability > 0.005:
             tts_like = float(min(tts_like, 0.90))
 
-        dzcr  = np.diff(np.concatenate([[zcr_arr[0] if zcr_arr.size else 0.0], zcr_arr])) if zcr_arr.size else np.zeros(1)
-        droll = np.diff(np.concatenate([[roll_arr[0] if roll_arr.size else 0.0], roll_arr])) if roll_arr.size else np.zeros(1)
-        tline = 0.5*_norm01(flat_arr) + 0.3*(1.0-_norm01(dzcr**2)) + 0.2*(1.0-_norm01(np.abs(droll)))
-        tline = np.clip(tline, 0.0, 1.0).tolist()
+        dzcr  = _diff_keep_len(zcr_arr)
+        droll = _diff_keep_len(roll_arr)
+        # 0.5*flat + 0.3*(1-dzcr²) + 0.2*(1-|droll|), con le costanti raccolte
+        # accumulato in place su un unico buffer, senza temporanei per ogni termine
+        tline = _norm01(flat_arr, out=np.empty(flat_arr.size, dtype=np.float32))
+        tline *= 0.5
+        term = _norm01(np.square(dzcr, out=dzcr), out=np.empty_like(tline))
+        term *= 0.3
+        tline -= term
+        _norm01(np.abs(droll, out=droll), out=term)
+        term *= 0.2
+        tline -= term
+        tline += 0.5
+        np.clip(tline, 0.0, 1.0, out=tline)
+
+        # Troncato solo se la sorgente supera il limite E l'audio decodificato lo raggiunge:
+        # una traccia audio più corta del video finisce prima, senza tagli.
+        # 0.5 s di tolleranza per i campioni che -t e il ricampionamento possono perdere
+        src_dur = _source_duration(path, meta)
+        truncated = src_dur > AUDIO_MAX_SECONDS and dur >= AUDIO_MAX_SECONDS - 0.5
 
-        tlen = int(max(1, round(dur)))
-        if len(tline) < tlen:
-            tline = tline + [tline[-1] if tline else 0.5] * (tlen - len(tline))
-        else:
-            tline = tline[:tlen]
+        # Allinea a un valore per secondo: tronca o ripete l'ultimo valore.
+        # Se l'audio è stato troncato la timeline copre comunque tutta la durata della
+        # sorgente, ma la parte non analizzata è neutra (0.5, come nei fallback di errore):
+        # ripetere l'ultimo valore analizzato peserebbe sul verdetto di tutta la coda
+        tlen = int(max(1, round(src_dur if truncated else dur)))
+        n = min(tlen, tline.size)
+        timeline = np.full(tlen, 0.5 if truncated else tline[n - 1], dtype=np.float32)
+        timeline[:n] = tline[:n]
 
         return {
             "scores": {
@@ -102,12 +201,15 @@ def analyze(path: str, meta: dict):
             "flags_audio": {
                 "speech_ratio": speech_ratio,
                 "tts_like": tts_like,
-                "rms_var": float(np.var(rms_arr)) if rms_arr.size else 0.0,
+                "rms_var": rms_var,
                 "zcr_var": zcr_var,
                 "roll_var": roll_var,
                 "sc_var": sc_var,
+                # Analisi limitata ai primi AUDIO_MAX_SECONDS secondi
+                "analyzed_s": dur,
+                "truncated": truncated,
             },
-            "timeline": tline
+            "timeline": timeline.tolist()
         }
     except Exception as e:
         tlen = int(max(1, round(meta.get("duration") or 0.0)))
@@ -116,7 +218,18 @@ def analyze(path: str, meta: dict):
             "flags_audio": {"error": str(e)},
             "timeline": [0.5]*tlen
         }
-    finally:
-        if tmp:
-            try: os.unlink(tmp)
-            except Exception: pass
\ No newline at end of file
+
+def _init_batch_worker():
+    # Un thread FFT/BLAS per processo: il parallelismo è già tra i file
+    global FFT_WORKERS
+    FFT_WORKERS = 1
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+def analyze_many(paths, metas, max_workers=None):
+    # Batch offline: un file per processo, risultati nello stesso ordine di `paths`
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker) as ex:
+        return list(ex.map(analyze, paths, metas, chunksize=4))
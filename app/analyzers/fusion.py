@@ -1,98 +1,154 @@
 import os
+from functools import lru_cache
 import numpy as np
+from scipy.ndimage import uniform_filter1d
 
 THRESH_REAL_MAX = float(os.getenv("THRESH_REAL_MAX", "0.35"))
 THRESH_AI_MIN   = float(os.getenv("THRESH_AI_MIN", "0.72"))
 
+# Pesi base conservativi e bonus di concordanza audio/video
+W_AUDIO = 0.65
+W_VIDEO = 0.25
+BONUS_AGREE = 0.10
+# Penalità per ciascun indizio di qualità scarsa
+PENALTY_STEP = 0.05
+
 def _bin_timeline(ts):
-    if not ts:
+    # Accetta liste o array: la conversione in lista avviene una sola volta, in uscita
+    arr = np.asarray(ts, dtype=float)
+    if not arr.size:
         return []
-    arr = np.array(ts, dtype=float)
-    if len(arr) >= 3:
-        ker = np.ones(3)/3.0
-        arr = np.convolve(arr, ker, mode="same")
+    if arr.size >= 3:
+        # Media mobile a 3 punti; ai bordi replica il valore estremo.
+        # Il filtro restituisce un array nuovo: il clip si fa in place
+        arr = uniform_filter1d(arr, size=3, mode="nearest")
+        return np.clip(arr, 0.0, 1.0, out=arr).tolist()
     return np.clip(arr, 0.0, 1.0).tolist()
 
-def fuse(audio: dict, video: dict, hints: dict):
-    a_t = audio.get("timeline") or []
-    v_t = video.get("timeline") or video.get("timeline_ai") or []
-    L = max(len(a_t), len(v_t), 1)
-    if len(a_t) < L: a_t += [a_t[-1] if a_t else 0.5]*(L-len(a_t))
-    if len(v_t) < L: v_t += [v_t[-1] if v_t else 0.5]*(L-len(v_t))
-
-    a = np.array(a_t, dtype=float)
-    v = np.array(v_t, dtype=float)
-
-    # Pesi base conservativi
-    w_audio = 0.65
-    w_video = 0.25
-    bonus_agree = 0.10 if np.sign(np.mean(a)-0.5) == np.sign(np.mean(v)-0.5) else 0.0
-
+@lru_cache(maxsize=8)
+def _weights(agree: bool, low_speech: bool, damp_audio: bool):
+    # Solo 8 combinazioni possibili: i pesi si calcolano una volta per combinazione
+    bonus_agree = BONUS_AGREE if agree else 0.0
+    w_audio, w_video = W_AUDIO, W_VIDEO
     # Dinamica pesi dal parlato
-    flags = audio.get("flags_audio", {})
-    speech_ratio = float(flags.get("speech_ratio", 0.0))
-    tts_like = float(flags.get("tts_like", 0.0))
-    if speech_ratio < 0.25:
+    if low_speech:
         w_audio *= 0.6
         w_video = max(0.2, 1.0 - w_audio - bonus_agree)
-
-    # Penalità qualità/compressione/duplicati
-    comp = hints.get("compression", "normal")
-    bpp  = hints.get("bpp", 0.0)
-    dup  = hints.get("dup_avg", 0.0)
-    penalties = 0.0
-    if comp in ("heavy", "very_heavy"): penalties += 0.05
-    if bpp < 0.07: penalties += 0.05
-    if dup > 0.2: penalties += 0.05
-
-    # Bonus “ripresa reale”
-    vsum = video.get("summary", {}) or {}
-    flow_mean = float(vsum.get("flow_mean", 0.0))
-    texture_var = float(vsum.get("texture_var", 0.0))
-    sc_rate = float(vsum.get("scene_change_rate", 0.0))
-    dup_density = float(vsum.get("dup_density", 0.0))
-
-    real_bonus = 0.0
-    if flow_mean > 5.0 and texture_var > 200.0 and dup_density < 0.05:
-        real_bonus -= 0.10
-    if sc_rate > 0.7:
-        real_bonus -= 0.05
-    if sc_rate >= 0.9 and texture_var > 300.0 and dup_density < 0.02:
-        real_bonus -= 0.08
-
     # Se tts_like molto alto ma video fortemente reale → smorza ancora l'audio
-    if tts_like >= 0.95 and flow_mean > 8.0 and texture_var > 300.0 and dup_density < 0.05:
+    if damp_audio:
         w_audio *= 0.55
         w_video = max(0.25, 1.0 - w_audio - bonus_agree)
+    return w_audio, w_video, bonus_agree
+
+def _as_array(ts):
+    # Timeline come lista di float o già come array NumPy (nessuna copia se float64)
+    return np.asarray(ts if ts is not None else [], dtype=float)
 
-    # Combinazione
-    timeline = (w_audio*a + w_video*v + bonus_agree*(a+v)/2.0) - penalties + real_bonus
-    timeline = np.clip(timeline, 0.0, 1.0)
+def _pad(ts, L: int):
+    # Array di lunghezza L: copia ts e ripete l'ultimo valore (0.5 se vuota)
+    out = np.full(L, ts[-1] if ts.size else 0.5, dtype=float)
+    out[:ts.size] = ts
+    return out
+
+def _fget(d: dict, key: str) -> float:
+    # Campo numerico opzionale: mancante o None valgono 0.0
+    return float(d.get(key) or 0.0)
+
+def _reason(rules, default: str) -> str:
+    # rules: coppie (condizione, frase); se nessuna condizione vale si usa default
+    return "; ".join([msg for cond, msg in rules if cond] or [default])
+
+def fuse(audio: dict, video: dict, hints: dict):
+    # Tutti i campi letti una sola volta, qui in testa
+    flags = audio.get("flags_audio", {}) or {}
+    speech_ratio = _fget(flags, "speech_ratio")
+    tts_like = _fget(flags, "tts_like")
+
+    vsum = video.get("summary", {}) or {}
+    flow_mean = _fget(vsum, "flow_mean")
+    texture_var = _fget(vsum, "texture_var")
+    sc_rate = _fget(vsum, "scene_change_rate")
+    dup_density = _fget(vsum, "dup_density")
+
+    comp = hints.get("compression", "normal")
+    bpp  = _fget(hints, "bpp")
+    dup  = _fget(hints, "dup_avg")
+    video_has_signal = hints.get("video_has_signal", True)
+
+    a_t = _as_array(audio.get("timeline"))
+    v_t = _as_array(video.get("timeline"))
+    if not v_t.size:
+        v_t = _as_array(video.get("timeline_ai"))
+    L = max(a_t.size, v_t.size, 1)
+    # Allinea a L senza modificare le timeline in ingresso
+    a = _pad(a_t, L)
+    v = _pad(v_t, L)
+    # Medie per canale, usate sia per la concordanza sia per il disaccordo
+    a_mean = float(a.mean())
+    v_mean = float(v.mean())
+
+    # Penalità qualità/compressione/duplicati
+    heavy = comp in ("heavy", "very_heavy")
+    # Un passo per indizio: somma dei booleani, senza catena di if
+    penalties = PENALTY_STEP * (heavy + (bpp < 0.07) + (dup > 0.2))
+
+    # Indizio di ripresa naturale, valutato una volta; la versione "forte" lo implica
+    natural = flow_mean > 5.0 and texture_var > 200.0 and dup_density < 0.05
+    strongly_natural = natural and flow_mean > 8.0 and texture_var > 300.0
+
+    # Bonus “ripresa reale”: un termine per indizio, come per le penalità
+    real_bonus = -(0.10 * natural + 0.05 * (sc_rate > 0.7)
+                   + 0.08 * (sc_rate >= 0.9 and texture_var > 300.0 and dup_density < 0.02))
+
+    # Pesi dalla tabella precalcolata: concordanza, parlato scarso, audio da smorzare
+    w_audio, w_video, bonus_agree = _weights(
+        bool(np.sign(a_mean-0.5) == np.sign(v_mean-0.5)),
+        speech_ratio < 0.25,
+        tts_like >= 0.95 and strongly_natural,
+    )
+
+    # Combinazione: w_a*a + w_v*v + bonus*(a+v)/2 - penalità + bonus reale.
+    # a e v sono copie locali (_pad) non più usate: si calcola in place su di esse.
+    # L'ordine delle operazioni resta quello della formula: raccogliere i coefficienti
+    # sposterebbe di un ulp i punteggi esattamente sulle soglie
+    agree = np.add(a, v)
+    timeline = a
+    timeline *= w_audio
+    v *= w_video
+    timeline += v
+    agree *= bonus_agree
+    agree /= 2.0
+    timeline += agree
+    timeline -= penalties
+    timeline += real_bonus
+    np.clip(timeline, 0.0, 1.0, out=timeline)
 
     # Picchi (escludi ~0.5)
-    peaks = [i for i, x in enumerate(timeline.tolist()) if x <= 0.25 or x >= 0.75]
+    peaks = np.nonzero((timeline <= 0.25) | (timeline >= 0.75))[0].tolist()
 
+    # Deviazione standard in due passaggi, riusando la media e il buffer di `agree`.
+    # Non E[x²] - E[x]²: un ulp di differenza basta a cambiare round(conf, 2)
     score = float(np.mean(timeline))
-    spread = float(np.std(timeline))
-    disagree = float(abs(np.mean(a) - np.mean(v)))
+    np.subtract(timeline, score, out=agree)
+    spread = float(np.sqrt(np.dot(agree, agree) / agree.size))
+    disagree = abs(a_mean - v_mean)
 
-    conf = float(np.clip(0.20 + 2.2*spread - penalties - 0.5*max(0.0, 0.3 - disagree), 0.10, 0.99))
+    # Clamp scalare con i builtin: np.clip su un float passa da un array 0-d
+    conf = min(0.99, max(0.10, 0.20 + 2.2*spread - penalties - 0.5*max(0.0, 0.3 - disagree)))
 
     if score <= THRESH_REAL_MAX:
         label = "real"
-        reason = []
-        if dup_density > 0.25: reason.append("molti frame duplicati")
-        if comp in ("heavy","very_heavy"): reason.append("compressione pesante")
-        if not reason: reason.append("segnali audio/video coerenti con ripresa reale")
-        reason = "; ".join(reason)
+        reason = _reason((
+            (dup_density > 0.25, "molti frame duplicati"),
+            (heavy, "compressione pesante"),
+        ), "segnali audio/video coerenti con ripresa reale")
     elif score >= THRESH_AI_MIN:
         label = "ai"
-        reason = []
-        if tts_like > 0.6: reason.append("audio TTS-like elevato")
-        if dup_density > 0.2: reason.append("molti frame duplicati")
-        if hints.get("video_has_signal", True) is False: reason.append("segnali video deboli")
-        if not reason: reason = ["pattern e indizi coerenti con generazione AI"]
-        reason = "; ".join(reason)
+        reason = _reason((
+            (tts_like > 0.6, "audio TTS-like elevato"),
+            (dup_density > 0.2, "molti frame duplicati"),
+            (video_has_signal is False, "segnali video deboli"),
+        ), "pattern e indizi coerenti con generazione AI")
     else:
         label = "uncertain"
         reason = "segnali misti o neutri"
@@ -104,6 +160,6 @@ def fuse(audio: dict, video: dict, hints: dict):
             "confidence": round(conf, 2),
             "reason": reason
         },
-        "timeline_binned": _bin_timeline(timeline.tolist()),
+        "timeline_binned": _bin_timeline(timeline),
         "peaks": peaks,
     }
\ No newline at end of file
@@ -1,5 +1,7 @@
 import json, subprocess
 
+__all__ = ["exiftool_json", "exiftool_json_batch", "c2pa_present", "detect_device", "forensic_summary"]
+
 def exiftool_json(path: str):
     try:
         out = subprocess.check_output(["exiftool","-json","-struct","-G1",path], text=True, stderr=subprocess.DEVNULL, timeout=20)
@@ -8,12 +10,39 @@ def exiftool_json(path: str):
     except Exception:
         return {}
 
-def c2pa_present(exif: dict) -> bool:
+def exiftool_json_batch(paths):
+    # Un solo avvio di ExifTool per più file: {SourceFile: dati}
+    if not paths:
+        return {}
     try:
-        t = json.dumps(exif).lower()
+        p = subprocess.run(["exiftool","-json","-struct","-G1",*paths], stdout=subprocess.PIPE,
+                           stderr=subprocess.DEVNULL, text=True, timeout=20 * len(paths))
+        data = json.loads(p.stdout or "[]")
+        return {d.get("SourceFile"): d for d in data if isinstance(d, dict)} if isinstance(data, list) else {}
     except Exception:
-        return False
-    return ("c2pa" in t) or ("jumbf" in t) or ("manifest" in t and "claim" in t)
+        return {}
+
+def c2pa_present(exif: dict) -> bool:
+    # Visita chiavi e valori senza serializzare il dict; esce al primo indizio.
+    # "manifest" e "claim" possono comparire in stringhe diverse, come nel JSON intero.
+    manifest = claim = False
+    stack = [exif]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, dict):
+            stack.extend(cur.keys())
+            stack.extend(cur.values())
+        elif isinstance(cur, (list, tuple)):
+            stack.extend(cur)
+        elif isinstance(cur, str):
+            t = cur.lower()
+            if "c2pa" in t or "jumbf" in t:
+                return True
+            manifest = manifest or "manifest" in t
+            claim = claim or "claim" in t
+            if manifest and claim:
+                return True
+    return False
 
 def detect_device(exif: dict):
     for k in ("QuickTime:Make","QuickTime:Model","EXIF:Make","EXIF:Model"):
@@ -21,8 +50,8 @@ def detect_device(exif: dict):
         if v: return str(v)
     return None
 
-def forensic_summary(path: str):
-    ex = exiftool_json(path)
+def forensic_summary(path: str, exif=None):
+    ex = exif if exif is not None else exiftool_json(path)
     return {
         "c2pa": {"present": c2pa_present(ex)},
         "exif_quick": {k: ex.get(k) for k in ("QuickTime:Make","QuickTime:Model","EXIF:Make","EXIF:Model") if k in ex}
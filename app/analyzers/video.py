@@ -1,12 +1,27 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
-def _average_hash(img, size=32):
-    g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    g = cv2.resize(g, (size, size), interpolation=cv2.INTER_AREA)
+# Thread per flusso ottico e texture: le funzioni OpenCV rilasciano il GIL
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+def _average_hash(gray, size=32):
+    g = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
     mean = g.mean()
     return (g >= mean).astype(np.uint8).flatten()
 
+def _frame_metrics(prev_small, small, gray):
+    # (media, varianza) del flusso rispetto al frame precedente, o None sul primo; texture
+    flow_stats = None
+    if prev_small is not None:
+        flow = cv2.calcOpticalFlowFarneback(prev_small, small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        mag = np.sqrt(flow[...,0]**2 + flow[...,1]**2)
+        flow_stats = (float(np.mean(mag)), float(np.var(mag)))
+    return flow_stats, float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
 def analyze(path: str, meta: dict):
     cap = cv2.VideoCapture(path)
     if not cap.isOpened():
@@ -20,44 +35,54 @@ def analyze(path: str, meta: dict):
     prev_hash = None
     dup = 0
     total = 0
-    flow_means, flow_vars, textures, timeline_ai = [], [], [], []
+    flow_means, flow_vars, textures = [], [], []
+
+    def collect(fut):
+        flow_stats, tex = fut.result()
+        if flow_stats is not None:
+            flow_means.append(flow_stats[0])
+            flow_vars.append(flow_stats[1])
+        textures.append(tex)
 
     index = 0
     prev_frame_small = None
-    while True:
-        ret = cap.grab()
-        if not ret:
-            break
-        if index % step == 0:
-            ok, frame = cap.retrieve()
-            if not ok: break
-            total += 1
+    # Decodifica e hash restano sequenziali; flusso e texture vanno nel pool.
+    # I risultati si raccolgono in ordine, con una coda limitata di frame in volo.
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=VIDEO_WORKERS) as pool:
+        while True:
+            ret = cap.grab()
+            if not ret:
+                break
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if not ok: break
+                total += 1
 
-            hsh = _average_hash(frame, size=32)
-            if prev_hash is not None:
-                ham = int(np.sum(hsh ^ prev_hash))
-                if ham == 0:
-                    dup += 1
-            prev_hash = hsh
+                # Una sola conversione in grigio, condivisa da hash, flusso ottico e texture
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                hsh = _average_hash(gray, size=32)
+                if prev_hash is not None:
+                    ham = int(np.sum(hsh ^ prev_hash))
+                    if ham == 0:
+                        dup += 1
+                prev_hash = hsh
 
-            small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (320, 320))
-            if prev_frame_small is not None:
-                flow = cv2.calcOpticalFlowFarneback(prev_frame_small, small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-                mag = np.sqrt(flow[...,0]**2 + flow[...,1]**2)
-                flow_means.append(float(np.mean(mag)))
-                flow_vars.append(float(np.var(mag)))
-            prev_frame_small = small
-
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            textures.append(float(cv2.Laplacian(gray, cv2.CV_64F).var()))
-
-            tex = textures[-1]
-            mot = flow_means[-1] if flow_means else 0.0
-            ai_susp = float(np.clip(1.0 - (tex/(tex+1000.0)) * (1.0 + mot), 0.0, 1.0))
-            timeline_ai.append(ai_susp)
-        index += 1
+                small = cv2.resize(gray, (320, 320))
+                pending.append(pool.submit(_frame_metrics, prev_frame_small, small, gray))
+                prev_frame_small = small
+                if len(pending) >= 2 * VIDEO_WORKERS:
+                    collect(pending.popleft())
+            index += 1
+        while pending:
+            collect(pending.popleft())
     cap.release()
 
+    # Sospetto AI per frame, vettoriale: il primo frame non ha flusso (moto 0)
+    tex = np.array(textures)
+    mot = np.concatenate(([0.0], flow_means))[:tex.size]
+    timeline_ai = np.clip(1.0 - (tex/(tex+1000.0)) * (1.0 + mot), 0.0, 1.0)
+
     dup_density = float(dup / max(1, total-1))
     sc_rate = float(np.mean(np.array(flow_vars)>0.5)) if flow_vars else 0.0
 
@@ -70,14 +95,11 @@ def analyze(path: str, meta: dict):
         "w": int(w), "h": int(h), "fps": float(fps)
     }
 
+    # Allinea a un valore per secondo: tronca o ripete l'ultimo valore
     tlen = int(max(1, round(duration)))
-    if len(timeline_ai) < tlen:
-        if timeline_ai:
-            last = timeline_ai[-1]
-            timeline_ai += [last]*(tlen-len(timeline_ai))
-        else:
-            timeline_ai = [0.5]*tlen
-    else:
-        timeline_ai = timeline_ai[:tlen]
+    n = min(tlen, len(timeline_ai))
+    aligned = np.full(tlen, timeline_ai[n - 1] if n else 0.5)
+    aligned[:n] = timeline_ai[:n]
+    timeline_ai = aligned.tolist()
 
     return {"timeline": timeline_ai, "summary": summary, "timeline_ai": timeline_ai}
\ No newline at end of file